@@ -1,17 +1,36 @@
 import os
+
+# Cooperative I/O for Twilio/Redis calls; must patch before socket/ssl/threading are imported
+if os.environ.get("GEVENT") == "1":
+    from gevent import monkey
+    monkey.patch_all()
+
 import json
+import logging
 import time
-from flask import Flask, request, Response, send_from_directory
-from xml.sax.saxutils import escape
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from flask import Flask, request, Response
+from whitenoise import WhiteNoise
 
-# Twilio client
+# Compact JSON for Twilio content_variables; orjson is C-accelerated
 try:
-    from twilio.rest import Client
+    import orjson
+
+    def _dumps(obj) -> str:
+        return orjson.dumps(obj).decode("utf-8")
 except ImportError:
-    Client = None
+    def _dumps(obj) -> str:
+        return json.dumps(obj, separators=(',', ':'), ensure_ascii=False)
+
+from question_loader import load_questions
+from session_store import MAX_SCORE, MemorySessionStore, RedisSessionStore, session_backend
 
-app = Flask(__name__)
-sessions = {}
+# /static is served by WhiteNoise (see below), not Flask's built-in view
+app = Flask(__name__, static_folder=None)
+# DEBUG logs every inbound payload and outbound send; keep INFO in production
+app.logger.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
 
 # Load config from environment
 TWILIO_ACCOUNT_SID = os.environ.get("TWILIO_ACCOUNT_SID")
@@ -19,162 +38,370 @@ TWILIO_AUTH_TOKEN = os.environ.get("TWILIO_AUTH_TOKEN")
 TWILIO_FROM = os.environ.get("TWILIO_FROM")
 TWILIO_CONTENT_SID_BUTTONS = os.environ.get("TWILIO_CONTENT_SID_BUTTONS")
 TWILIO_CONTENT_SID_IMAGE = os.environ.get("TWILIO_CONTENT_SID_IMAGE")
+# Optional media + buttons template ({{1}} image, {{2}} body): one message per image question
+TWILIO_CONTENT_SID_IMAGE_BUTTONS = os.environ.get("TWILIO_CONTENT_SID_IMAGE_BUTTONS")
 
 # Configurable delay (default: 5 seconds)
 IMAGE_DELAY_SECONDS = int(os.environ.get("IMAGE_DELAY_SECONDS", "5"))
 
+# Outbound Twilio sends run in the background so the webhook returns right away
+OUTBOUND_WORKERS = int(os.environ.get("OUTBOUND_WORKERS", "16"))
+TWILIO_HTTP_TIMEOUT_SECONDS = float(os.environ.get("TWILIO_HTTP_TIMEOUT_SECONDS", "15"))
+
 USE_TWILIO_INTERACTIVE = (
     os.environ.get("USE_TWILIO_INTERACTIVE", "0") == "1"
     and TWILIO_ACCOUNT_SID
     and TWILIO_AUTH_TOKEN
     and TWILIO_FROM
     and TWILIO_CONTENT_SID_BUTTONS
-    and TWILIO_CONTENT_SID_IMAGE
+    and (TWILIO_CONTENT_SID_IMAGE or TWILIO_CONTENT_SID_IMAGE_BUTTONS)
 )
 
 twilio_client = None
+outbound_pool = None
 if USE_TWILIO_INTERACTIVE:
-    if Client is None:
+    # Imported here so TwiML-only deployments never load the (large) Twilio SDK
+    try:
+        from twilio.rest import Client
+        from twilio.http.http_client import TwilioHttpClient
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+    except ImportError:
         raise RuntimeError("Install 'twilio' package")
-    twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+    # One pooled keep-alive connection per outbound thread, so sends reuse TLS
+    # sessions to api.twilio.com instead of re-handshaking; the timeout keeps a
+    # stalled request from tying up a send thread indefinitely
+    twilio_http = TwilioHttpClient(timeout=TWILIO_HTTP_TIMEOUT_SECONDS)
+    twilio_http.session.mount(
+        "https://",
+        HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=OUTBOUND_WORKERS,
+            max_retries=Retry(total=2, backoff_factor=0.1),
+        ),
+    )
+    twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, http_client=twilio_http)
+    outbound_pool = ThreadPoolExecutor(max_workers=OUTBOUND_WORKERS, thread_name_prefix="twilio-send")
+
+    def _warm_twilio():
+        # Pay the SDK's lazy imports and the first TLS handshake before the first
+        # user's webhook; the warmed connection stays in the pool
+        try:
+            twilio_client.api.accounts(TWILIO_ACCOUNT_SID).fetch()
+        except Exception as e:
+            app.logger.warning("Twilio warmup failed: %s", e)
+
+    # In the background: with timeouts and retries a slow api.twilio.com could
+    # otherwise hold up boot past gunicorn's worker timeout
+    outbound_pool.submit(_warm_twilio)
+
+
+QUESTIONS_PATH = "questions.json"
+# Validated questions, reused across cold starts while questions.json is unchanged
+QUESTIONS_CACHE_PATH = "questions.cache.pkl"
+
+QUESTIONS = load_questions(QUESTIONS_PATH, QUESTIONS_CACHE_PATH)
+# The packed session score can't exceed MAX_SCORE
+if len(QUESTIONS) > MAX_SCORE:
+    raise RuntimeError(f"At most {MAX_SCORE} questions are supported")
+
+# Sessions live in Redis when REDIS_URL is set, otherwise in process memory
+REDIS_URL = os.environ.get("REDIS_URL")
+SESSION_BACKEND = session_backend()
+SESSION_TTL_SECONDS = int(os.environ.get("SESSION_TTL_SECONDS", "3600"))
+
+if SESSION_BACKEND == "redis":
+    if not REDIS_URL:
+        raise RuntimeError("SESSION_BACKEND=redis requires REDIS_URL")
+    session_store = RedisSessionStore(REDIS_URL, SESSION_TTL_SECONDS, len(QUESTIONS))
+elif SESSION_BACKEND == "memory":
+    session_store = MemorySessionStore(len(QUESTIONS))
+else:
+    raise RuntimeError(f"Unknown SESSION_BACKEND {SESSION_BACKEND!r} (use 'redis' or 'memory')")
+
+# Questions never change after boot, so everything the webhook reads per
+# question is precomputed into parallel lists indexed by question number
+_FORMATTED_QUESTIONS: list[str] = [
+    q.text + "\n" + "\n".join(q.options) for q in QUESTIONS
+]
+_INVALID_CHOICE: list[str] = [
+    "Invalid choice. Please select one of:\n" + "\n".join(q.options) for q in QUESTIONS
+]
+_ANSWERS: list[str] = [q.answer for q in QUESTIONS]
+_HINTS: list[str] = [
+    q.hint if q.hint is not None else "No hint available." for q in QUESTIONS
+]
+_EXPLANATIONS: list[str] = [
+    f"\nℹ️ {q.explanation}" if q.explanation else "" for q in QUESTIONS
+]
+
+# Content API variables. Button titles and image URLs are fixed per question,
+# so only the {{1}} body text is serialized per send (see send_question_interactive).
+# WhatsApp template parameters can't contain newlines, so body text is kept on one line
+_INLINE_QUESTIONS: list[str] = [" ".join(q.text.split()) for q in QUESTIONS]
+_INLINE_SEP = " — "
+_BUTTON_VARS_TAIL: list[str] = [
+    "," + _dumps({f"btn{idx}_title": opt for idx, opt in enumerate(q.options, start=1)})[1:]
+    for q in QUESTIONS
+]
+
+
+# Twilio fetches media itself, so image_url paths under /static are sent as
+# absolute URLs on the app's public host (RENDER_EXTERNAL_URL is set by Render)
+PUBLIC_BASE_URL = os.environ.get("RENDER_EXTERNAL_URL", "http://localhost:3000").rstrip("/")
+
+
+def _media_url(image_url: str) -> str:
+    if "://" in image_url:
+        return image_url
+    return f"{PUBLIC_BASE_URL}/{image_url.lstrip('/')}"
+
+
+_IMAGE_VARS: list[str | None] = [
+    _dumps({"1": _media_url(q.image_url)}) if q.image_url is not None else None
+    for q in QUESTIONS
+]
+_IMAGE_BUTTON_VARS_HEAD: list[str | None] = [
+    '{"1":' + _dumps(_media_url(q.image_url)) + ',"2":' if q.image_url is not None else None
+    for q in QUESTIONS
+]
+
+
+def _answer_map(options) -> dict[str, str]:
+    # Exact option text (what the buttons send) plus case-folded forms for
+    # typed replies, skipping any folded form shared by two options
+    folded = [opt.casefold() for opt in options]
+    m = {key: opt for opt, key in zip(options, folded) if folded.count(key) == 1}
+    m.update((opt, opt) for opt in options)
+    return m
+
+
+# Accepted replies per question, mapped to the canonical option text
+_ANSWER_MAPS: list[dict[str, str]] = [_answer_map(q.options) for q in QUESTIONS]
+
+
+WELCOME = f"Welcome to the Singapore Quiz! {len(QUESTIONS)} questions await. Tap a button to answer."
+_START_MESSAGE = f"{WELCOME}\n\n{_FORMATTED_QUESTIONS[0]}"
+
+# End-of-quiz remark indexed by percentage (0..100)
+_SCORE_REMARKS = tuple(" 🇸🇬 Perfect!" if pct == 100 else "" for pct in range(101))
+
+
+def format_question(i: int) -> str:
+    return _FORMATTED_QUESTIONS[i]
+
+
+@lru_cache(maxsize=None)
+def feedback_for(i: int, is_correct: bool, inline: bool = False) -> str:
+    """Feedback (plus explanation) shown after answering question i; inline
+    collapses it onto one line for use in a template variable."""
+    if is_correct:
+        text = "✅ Correct!" + _EXPLANATIONS[i]
+    else:
+        text = f"❌ Incorrect. The answer is: {_ANSWERS[i]}." + _EXPLANATIONS[i]
+    return " ".join(text.split()) if inline else text
 
 
-def load_questions():
-    with open("questions.json", "r", encoding="utf-8") as f:
-        return json.load(f)
+def normalize_answer(i: int, text: str):
+    """Map a reply to one of question i's options, or None if it isn't one."""
+    answers = _ANSWER_MAPS[i]
+    return answers.get(text) or answers.get(text.casefold())
 
 
-QUESTIONS = load_questions()
+# Serve static files (e.g., static/images/merlion.jpg) from WhiteNoise, which
+# answers from a file index built at startup without entering Flask. Question
+# images are fetched by Twilio/WhatsApp and never change under the same name,
+# so let them and any CDN cache for a year (rename the file to publish a new image).
+STATIC_MAX_AGE_SECONDS = int(os.environ.get("STATIC_MAX_AGE_SECONDS", "31536000"))
 
 
-# Serve static files (e.g., static/images/merlion.jpg)
-@app.route('/static/<path:filename>')
-def static_files(filename):
-    return send_from_directory('static', filename)
+def _static_cache_headers(headers, path, url):
+    headers["Cache-Control"] = f"public, max-age={STATIC_MAX_AGE_SECONDS}, immutable"
+
+
+app.wsgi_app = WhiteNoise(
+    app.wsgi_app,
+    root="static",
+    prefix="static/",
+    max_age=STATIC_MAX_AGE_SECONDS,
+    add_headers_function=_static_cache_headers,
+)
+
+
+_TWIML_PREFIX = b'<?xml version="1.0" encoding="UTF-8"?><Response><Message>'
+_TWIML_SUFFIX = b'</Message></Response>'
+_TWIML_EMPTY = b'<?xml version="1.0" encoding="UTF-8"?><Response></Response>'
+
+
+def twiml_empty() -> Response:
+    # No reply at all; Twilio sends nothing back to the user
+    return Response(_TWIML_EMPTY, mimetype="application/xml")
 
 
 def twiml(message: str) -> Response:
-    xml = f'<?xml version="1.0" encoding="UTF-8"?><Response><Message>{escape(message)}</Message></Response>'
-    return Response(xml, mimetype="application/xml")
+    # Element text only needs &, < and > escaped (no attributes here); most
+    # messages have none, so check before paying for the replace passes
+    if "&" in message or "<" in message or ">" in message:
+        message = message.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    return Response(_TWIML_PREFIX + message.encode("utf-8") + _TWIML_SUFFIX, mimetype="application/xml")
+
+
+# --- Commands ---
+def _cmd_start(from_number: str):
+    session_store.start(from_number)
+    if USE_TWILIO_INTERACTIVE:
+        _send_async(send_question_interactive, from_number, 0, WELCOME)
+        return ("OK", 200)
+    else:
+        return twiml(_START_MESSAGE)
+
+
+def _cmd_hint(from_number: str):
+    state = session_store.get(from_number)
+    if not state:
+        return twiml("Send START first.")
+    return twiml(_HINTS[state[0]])
+
+
+# Lowercased message body -> handler
+_COMMANDS = {"start": _cmd_start, "restart": _cmd_start, "hint": _cmd_hint}
+# Longer bodies (most answers, all button taps with long titles) can't be commands
+_MAX_COMMAND_LEN = max(map(len, _COMMANDS))
+
+
+def _twilio_form() -> dict:
+    # Twilio always posts small urlencoded bodies; parse them directly rather
+    # than through Werkzeug's general form parser
+    if request.mimetype != "application/x-www-form-urlencoded":
+        return request.form.to_dict()
+    return dict(urllib.parse.parse_qsl(request.get_data(as_text=True), keep_blank_values=True))
 
 
 @app.post("/whatsapp")
 def whatsapp():
-    from_number = request.form.get("From", "unknown")
-    body = (request.form.get("Body") or "").strip()
-
-    if body.lower() in ("start", "restart"):
-        sessions[from_number] = {"index": 0, "score": 0}
-        welcome = f"Welcome to the Singapore Quiz! {len(QUESTIONS)} questions await. Tap a button to answer."
-        if USE_TWILIO_INTERACTIVE:
-            send_text(from_number, welcome)
-            send_question_interactive(from_number, 0)
-            return ("OK", 200)
-        else:
-            q = QUESTIONS[0]
-            options = "\n".join(q["options"])
-            return twiml(f"{welcome}\n\n{q['question']}\n{options}")
-
-    if body.lower() == "hint":
-        state = sessions.get(from_number)
-        if not state:
-            return twiml("Send START first.")
-        q = QUESTIONS[state["index"]]
-        return twiml(q.get("hint", "No hint available."))
-
-    state = sessions.get(from_number)
+    form = _twilio_form()
+    if app.logger.isEnabledFor(logging.DEBUG):
+        app.logger.debug(">>> INCOMING WEBHOOK PAYLOAD: %s", form)
+    from_number = form.get("From", "unknown")
+    body = (form.get("Body") or "").strip()
+    if 0 < len(body) <= _MAX_COMMAND_LEN:
+        handler = _COMMANDS.get(body.lower())
+        if handler is not None:
+            return handler(from_number)
+
+    state = session_store.get(from_number)
     if not state:
         return twiml("Send START to begin the quiz.")
 
-    q_index = state["index"]
-    current_q = QUESTIONS[q_index]
-    user_answer = body.strip()
+    q_index = state[0]
+    user_answer = normalize_answer(q_index, body)
 
-    if user_answer not in current_q["options"]:
-        valid_opts = "\n".join(current_q["options"])
-        return twiml(f"Invalid choice. Please select one of:\n{valid_opts}")
+    if user_answer is None:
+        return twiml(_INVALID_CHOICE[q_index])
 
-    is_correct = (user_answer == current_q["answer"])
-    if is_correct:
-        state["score"] += 1
-        feedback = "✅ Correct!"
-    else:
-        feedback = f"❌ Incorrect. The answer is: {current_q['answer']}."
+    is_correct = (user_answer == _ANSWERS[q_index])
+    state = session_store.advance(from_number, q_index, is_correct)
+    if state is None:
+        # Stale or duplicate reply (e.g. a double-tapped button): an overlapping
+        # request already graded this question, so send nothing
+        return twiml_empty()
+    next_index, score = state
 
-    state["index"] += 1
-    expl = f"\nℹ️ {current_q.get('explanation', '')}" if current_q.get("explanation") else ""
+    if USE_TWILIO_INTERACTIVE and next_index < len(QUESTIONS):
+        _send_async(send_question_interactive, from_number, next_index, feedback_for(q_index, is_correct, True))
+        return ("OK", 200)
 
-    if state["index"] >= len(QUESTIONS):
-        score = state["score"]
+    feedback = feedback_for(q_index, is_correct)
+    if next_index >= len(QUESTIONS):
+        # advance() already ended the session
         total = len(QUESTIONS)
         pct = round((score / total) * 100)
-        msg = f"{feedback}{expl}\n\nQuiz complete! Score: {score}/{total} ({pct}%)."
-        if pct == 100:
-            msg += " 🇸🇬 Perfect!"
-        sessions.pop(from_number, None)
+        msg = f"{feedback}\n\nQuiz complete! Score: {score}/{total} ({pct}%).{_SCORE_REMARKS[pct]}"
         return twiml(msg + "\nSend START to play again.")
 
-    if USE_TWILIO_INTERACTIVE:
-        send_text(from_number, f"{feedback}{expl}")
-        send_question_interactive(from_number, state["index"])
-        return ("OK", 200)
-    else:
-        next_q = QUESTIONS[state["index"]]
-        options = "\n".join(next_q["options"])
-        return twiml(f"{feedback}{expl}\n\n{next_q['question']}\n{options}")
+    return twiml(f"{feedback}\n\n{format_question(next_index)}")
 
 
 # --- Twilio outbound helpers ---
-def send_text(to_whatsapp: str, body: str):
-    twilio_client.messages.create(from_=TWILIO_FROM, to=to_whatsapp, body=body)
+def log_send_failure(future):
+    # Background sends have no caller to raise to, so surface errors in the log
+    exc = future.exception()
+    if exc is not None:
+        app.logger.error("Outbound Twilio send failed", exc_info=exc)
 
 
-def send_question_interactive(to_whatsapp: str, i: int):
-    q = QUESTIONS[i]
-    
-    if "image_url" in q:
-        # ✅ MESSAGE 1: Send image only
-        twilio_client.messages.create(
-            from_=TWILIO_FROM,
-            to=to_whatsapp,
-            content_sid=TWILIO_CONTENT_SID_IMAGE,
-            content_variables=json.dumps({"1": q["image_url"]}, separators=(',', ':'))
-        )
-        
-        # ⏳ Wait for image to load (configurable delay)
-        time.sleep(IMAGE_DELAY_SECONDS)
-        
-        # ✅ MESSAGE 2: Send question + buttons
-        vars_obj = {
-            "1": q["question"],
-            "btn1_title": q["options"][0],
-            "btn2_title": q["options"][1],
-            "btn3_title": q["options"][2]
-        }
+def _send_async(fn, *args):
+    # Runs fn on the outbound pool; the pooled Twilio HTTP session lets each
+    # worker thread reuse a keep-alive connection
+    outbound_pool.submit(fn, *args).add_done_callback(log_send_failure)
+
+
+def send_question_interactive(to_whatsapp: str, i: int, preface: str | None = None):
+    # preface (welcome or feedback, on one line) rides in the question body so
+    # it costs no extra API call, except ahead of a separate image message
+    if app.logger.isEnabledFor(logging.DEBUG):
+        app.logger.debug(">>> SENDING QUESTION %d TO %s", i, to_whatsapp)
+
+    image_vars = _IMAGE_VARS[i]
+    if image_vars is not None and TWILIO_CONTENT_SID_IMAGE_BUTTONS:
+        # Image, question and buttons in a single message
+        text = f"{preface}{_INLINE_SEP}{_INLINE_QUESTIONS[i]}" if preface else _INLINE_QUESTIONS[i]
         twilio_client.messages.create(
             from_=TWILIO_FROM,
             to=to_whatsapp,
-            content_sid=TWILIO_CONTENT_SID_BUTTONS,
-            content_variables=json.dumps(vars_obj, separators=(',', ':'))
+            content_sid=TWILIO_CONTENT_SID_IMAGE_BUTTONS,
+            content_variables=_IMAGE_BUTTON_VARS_HEAD[i] + _dumps(text) + _BUTTON_VARS_TAIL[i]
         )
-    else:
-        # Text-only question
-        vars_obj = {"1": q["question"]}
-        for idx, btn_text in enumerate(q["options"], start=1):
-            vars_obj[f"btn{idx}_title"] = btn_text
+        return
+
+    if image_vars is not None:
+        if preface:
+            # Sent first on its own, so feedback isn't held back behind the image and delay
+            twilio_client.messages.create(from_=TWILIO_FROM, to=to_whatsapp, body=preface)
+            preface = None
+
+        # ✅ MESSAGE 1: Send image only
         twilio_client.messages.create(
             from_=TWILIO_FROM,
             to=to_whatsapp,
-            content_sid=TWILIO_CONTENT_SID_BUTTONS,
-            content_variables=json.dumps(vars_obj, separators=(',', ':'))
+            content_sid=TWILIO_CONTENT_SID_IMAGE,
+            content_variables=image_vars
         )
 
+        # ⏳ Wait for image to load (configurable delay)
+        time.sleep(IMAGE_DELAY_SECONDS)
+
+    # Question + buttons
+    text = f"{preface}{_INLINE_SEP}{_INLINE_QUESTIONS[i]}" if preface else _INLINE_QUESTIONS[i]
+    twilio_client.messages.create(
+        from_=TWILIO_FROM,
+        to=to_whatsapp,
+        content_sid=TWILIO_CONTENT_SID_BUTTONS,
+        content_variables='{"1":' + _dumps(text) + _BUTTON_VARS_TAIL[i]
+    )
+
 
 @app.get("/")
 def health():
     return "OK", 200
 
 
+class HealthCheckMiddleware:
+    """Answer GET / (the platform health check) without going through Flask."""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        if environ.get("PATH_INFO") == "/" and environ.get("REQUEST_METHOD") == "GET":
+            start_response("200 OK", [("Content-Type", "text/plain; charset=utf-8"), ("Content-Length", "2")])
+            return [b"OK"]
+        return self.wsgi_app(environ, start_response)
+
+
+app.wsgi_app = HealthCheckMiddleware(app.wsgi_app)
+
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", "3000"))
     app.run(host="0.0.0.0", port=port)
\ No newline at end of file
@@ -0,0 +1,13 @@
+import os
+
+from session_store import session_backend
+
+# The webhook spends its time waiting on Twilio and Redis, so gevent workers
+# let each process serve many requests concurrently.
+bind = f"0.0.0.0:{os.environ.get('PORT', '3000')}"
+worker_class = "gevent"
+# Concurrent requests per worker; each mostly waits on Twilio/Redis
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", "1000"))
+
+# In-memory sessions are per process, so only run several workers with Redis
+workers = int(os.environ.get("WEB_CONCURRENCY", "2" if session_backend() == "redis" else "1"))
@@ -0,0 +1,120 @@
+"""Load and validate questions.json.
+
+Kept free of Flask and fully type-annotated so it can be compiled with mypyc
+(`mypyc question_loader.py`); the resulting extension module is imported in
+place of this file with no other changes.
+"""
+import logging
+import os
+import pickle
+import sys
+from typing import Any, Callable, NamedTuple
+
+import fastjsonschema  # type: ignore[import-untyped]
+
+try:
+    from orjson import loads as _loads
+except ImportError:
+    from json import loads as _loads  # type: ignore[assignment]
+
+
+class Question(NamedTuple):
+    """One validated quiz question; optional fields are None when absent."""
+    id: int | None
+    text: str
+    options: tuple[str, ...]
+    answer: str
+    hint: str | None
+    explanation: str | None
+    image_url: str | None
+
+
+log = logging.getLogger(__name__)
+
+QUESTION_SCHEMA: dict[str, Any] = {
+    "type": "object",
+    "required": ["question", "options", "answer"],
+    "properties": {
+        "id": {"type": "integer"},
+        "question": {"type": "string", "minLength": 1},
+        "options": {
+            "type": "array",
+            "items": {"type": "string", "minLength": 1},
+            "minItems": 2,
+            "maxItems": 3,  # WhatsApp allows at most 3 Quick Reply buttons
+            "uniqueItems": True,
+        },
+        "answer": {"type": "string"},
+        "hint": {"type": "string"},
+        "explanation": {"type": "string"},
+        "image_url": {"type": "string"},
+    },
+}
+
+QUESTIONS_SCHEMA: dict[str, Any] = {"type": "array", "minItems": 1, "items": QUESTION_SCHEMA}
+
+# Bump when the cached structure changes so stale pickles are ignored
+CACHE_VERSION = 4
+
+# Compiled once into straight-line Python that checks the whole file in one call
+validate_questions: Callable[[Any], Any] = fastjsonschema.compile(QUESTIONS_SCHEMA)
+
+
+def _schema_error(path: str, e: Any) -> ValueError:
+    where = f"{path} question {int(e.path[1]) + 1}" if len(e.path) > 1 else path
+    return ValueError(f"{where}: {e.message}")
+
+
+def parse_questions(path: str) -> list[Question]:
+    with open(path, "rb") as f:
+        data = _loads(f.read())
+    try:
+        validate_questions(data)
+    except fastjsonschema.JsonSchemaValueException as e:
+        raise _schema_error(path, e) from e
+
+    questions: list[Question] = []
+    for n, q in enumerate(data, start=1):
+        if q["answer"] not in q["options"]:
+            raise ValueError(f"{path} question {n}: answer must match one of the options")
+        # Interned so repeated options share one object and the answer *is*
+        # the matching option, making answer checks an identity compare
+        options = tuple(sys.intern(o) for o in q["options"])
+        questions.append(Question(
+            id=q.get("id"),
+            text=q["question"],
+            options=options,
+            answer=sys.intern(q["answer"]),
+            hint=q.get("hint"),
+            explanation=q.get("explanation"),
+            image_url=q.get("image_url"),
+        ))
+    return questions
+
+
+def load_questions(path: str, cache_path: str) -> list[Question]:
+    """Return the validated questions, reusing cache_path while path is unchanged."""
+    st = os.stat(path)
+    sig = (CACHE_VERSION, st.st_mtime_ns, st.st_size)
+    # The cache holds two pickles: the signature, then the questions. Only the
+    # signature is read from a stale cache, so old class layouts are never loaded
+    try:
+        with open(cache_path, "rb") as f:
+            if pickle.load(f) == sig:
+                data: list[Question] = pickle.load(f)
+                return data
+    except Exception:
+        # Missing, truncated or unreadable: fall back to parsing
+        pass
+
+    data = parse_questions(path)
+    # Write-then-rename so workers booting together never read a partial file
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            pickle.dump(sig, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        log.warning("Could not write %s; questions will be re-parsed on next start", cache_path)
+    return data
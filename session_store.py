@@ -0,0 +1,155 @@
+"""Per-sender quiz state: which question they are on and their score.
+
+A session is stored as one int, (index << 8) | score, so recording an answer
+is a single addition in memory and a single INCRBY in Redis.
+"""
+import os
+import threading
+from abc import ABC, abstractmethod
+
+SCORE_BITS = 8
+MAX_SCORE = (1 << SCORE_BITS) - 1
+
+
+def unpack(state: int):
+    return state >> SCORE_BITS, state & MAX_SCORE
+
+
+def _step(is_correct: bool) -> int:
+    return (1 << SCORE_BITS) + (1 if is_correct else 0)
+
+
+def session_backend() -> str:
+    """The configured backend name: SESSION_BACKEND, else redis when REDIS_URL is set."""
+    return os.environ.get("SESSION_BACKEND", "redis" if os.environ.get("REDIS_URL") else "memory")
+
+
+class SessionStore(ABC):
+    @abstractmethod
+    def start(self, from_number: str):
+        ...
+
+    @abstractmethod
+    def get(self, from_number: str):
+        """Return (index, score) for the sender, or None if no quiz is running."""
+
+    @abstractmethod
+    def advance(self, from_number: str, expected_index: int, is_correct: bool):
+        """Record an answer to question expected_index and move on; returns the new
+        (index, score), or None if the session ended or already moved past it.
+        Answering the last question ends the session in the same step."""
+
+    @abstractmethod
+    def delete(self, from_number: str):
+        ...
+
+
+class MemorySessionStore(SessionStore):
+    """Process-local sessions; lost on restart and not shared between workers."""
+
+    # Split across lock-guarded shards so concurrent requests can't interleave
+    # updates to one sender and rarely wait on others
+    SHARDS = 16  # power of two, so the shard index is a bit mask
+
+    def __init__(self, question_count: int):
+        self._shards: list[dict[str, int]] = [{} for _ in range(self.SHARDS)]
+        self._locks = [threading.Lock() for _ in range(self.SHARDS)]
+        self._question_count = question_count
+
+    def _shard(self, from_number: str):
+        i = hash(from_number) & (self.SHARDS - 1)
+        return self._locks[i], self._shards[i]
+
+    def start(self, from_number: str):
+        lock, shard = self._shard(from_number)
+        with lock:
+            shard[from_number] = 0
+
+    def get(self, from_number: str):
+        lock, shard = self._shard(from_number)
+        with lock:
+            state = shard.get(from_number)
+        return None if state is None else unpack(state)
+
+    def advance(self, from_number: str, expected_index: int, is_correct: bool):
+        lock, shard = self._shard(from_number)
+        with lock:
+            state = shard.get(from_number)
+            # Compare-and-set: a duplicate tap graded against the same question loses
+            if state is None or state >> SCORE_BITS != expected_index:
+                return None
+            state += _step(is_correct)
+            if state >> SCORE_BITS >= self._question_count:
+                del shard[from_number]
+            else:
+                shard[from_number] = state
+        return unpack(state)
+
+    def delete(self, from_number: str):
+        lock, shard = self._shard(from_number)
+        with lock:
+            shard.pop(from_number, None)
+
+
+# Advance only if the session exists and is still on the graded question, so
+# an overlapping reply or an expired key never resurrects a finished quiz; the
+# last answer deletes the key. KEYS[1] = session key;
+# ARGV = expected index, step, TTL seconds, question count
+_ADVANCE_SCRIPT = f"""
+local state = redis.call('GET', KEYS[1])
+if not state or math.floor(tonumber(state) / {1 << SCORE_BITS}) ~= tonumber(ARGV[1]) then
+  return false
+end
+local new_state = redis.call('INCRBY', KEYS[1], ARGV[2])
+if math.floor(new_state / {1 << SCORE_BITS}) >= tonumber(ARGV[4]) then
+  redis.call('DEL', KEYS[1])
+else
+  redis.call('EXPIRE', KEYS[1], ARGV[3])
+end
+return new_state
+"""
+
+
+class RedisSessionStore(SessionStore):
+    """Sessions shared by all workers, expiring after ttl_seconds of inactivity.
+
+    Sessions outlive redeploys, so one left past the last of question_count
+    questions (e.g. after questions.json was shortened) reads as no session.
+    """
+
+    def __init__(self, url: str, ttl_seconds: int, question_count: int):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("Install 'redis' package")
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._ttl = ttl_seconds
+        self._question_count = question_count
+        # Sent once, then run by SHA (EVALSHA) on every answer
+        self._advance = self._redis.register_script(_ADVANCE_SCRIPT)
+
+    @staticmethod
+    def _key(from_number: str) -> str:
+        return f"quiz:state:{from_number}"
+
+    def start(self, from_number: str):
+        self._redis.set(self._key(from_number), 0, ex=self._ttl)
+
+    def get(self, from_number: str):
+        state = self._redis.get(self._key(from_number))
+        if state is None:
+            return None
+        index, score = unpack(int(state))
+        return None if index >= self._question_count else (index, score)
+
+    def advance(self, from_number: str, expected_index: int, is_correct: bool):
+        # One round trip: check, bump index/score and refresh the TTL (or end
+        # the session after the last question) atomically
+        state = self._advance(
+            keys=[self._key(from_number)],
+            args=[expected_index, _step(is_correct), self._ttl, self._question_count],
+        )
+        return None if state is None else unpack(int(state))
+
+    def delete(self, from_number: str):
+        self._redis.delete(self._key(from_number))
@@ -0,0 +1,66 @@
+import os
+import pickle
+
+import pytest
+
+import question_loader
+from question_loader import CACHE_VERSION, load_questions
+
+QUESTIONS_JSON = b'[{"question": "Capital?", "options": ["Singapore", "Jurong"], "answer": "Singapore"}]'
+
+# Protocol 0 pickle of a class that no longer exists in question_loader
+_REMOVED_CLASS = b"cquestion_loader\nRemovedQuestion\n."
+
+
+def _unpickled_stale_payload():
+    # pytest.fail raises a BaseException, so load_questions can't swallow it
+    pytest.fail("cached questions were unpickled despite a stale signature")
+
+
+class _Tripwire:
+    def __reduce__(self):
+        return (_unpickled_stale_payload, ())
+
+
+def _write_questions(tmp_path):
+    path = tmp_path / "questions.json"
+    path.write_bytes(QUESTIONS_JSON)
+    return str(path)
+
+
+def _sig(path):
+    st = os.stat(path)
+    return (CACHE_VERSION, st.st_mtime_ns, st.st_size)
+
+
+def test_cache_is_written_and_reused(tmp_path, monkeypatch):
+    path = _write_questions(tmp_path)
+    cache = str(tmp_path / "questions.cache.pkl")
+    first = load_questions(path, cache)
+    assert [q.answer for q in first] == ["Singapore"]
+
+    def no_parse(path):
+        raise AssertionError("questions.json was re-parsed")
+
+    monkeypatch.setattr(question_loader, "parse_questions", no_parse)
+    assert load_questions(path, cache) == first
+
+
+def test_stale_cache_data_is_never_unpickled(tmp_path):
+    path = _write_questions(tmp_path)
+    cache = tmp_path / "questions.cache.pkl"
+    cache.write_bytes(pickle.dumps((CACHE_VERSION - 1, 0, 0)) + pickle.dumps(_Tripwire()))
+    assert [q.answer for q in load_questions(path, str(cache))] == ["Singapore"]
+
+
+@pytest.mark.parametrize("layout", ["single pickle", "after matching signature", "truncated"])
+def test_unreadable_cache_falls_back_to_parsing(tmp_path, layout):
+    path = _write_questions(tmp_path)
+    cache = tmp_path / "questions.cache.pkl"
+    contents = {
+        "single pickle": _REMOVED_CLASS,
+        "after matching signature": pickle.dumps(_sig(path)) + _REMOVED_CLASS,
+        "truncated": pickle.dumps(_sig(path))[:-1],
+    }[layout]
+    cache.write_bytes(contents)
+    assert [q.answer for q in load_questions(path, str(cache))] == ["Singapore"]
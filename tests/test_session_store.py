@@ -0,0 +1,64 @@
+import pytest
+
+from session_store import SCORE_BITS, MemorySessionStore, RedisSessionStore
+
+QUESTION_COUNT = 3
+
+
+def _redis_store(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")  # fakeredis needs it to run the advance script
+    import redis
+
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(
+        redis.Redis, "from_url",
+        lambda url, **kwargs: fakeredis.FakeRedis(server=server, **kwargs),
+    )
+    return RedisSessionStore("redis://test", 60, QUESTION_COUNT)
+
+
+@pytest.fixture(params=["memory", "redis"])
+def store(request, monkeypatch):
+    if request.param == "memory":
+        return MemorySessionStore(QUESTION_COUNT)
+    return _redis_store(monkeypatch)
+
+
+def test_advance_records_answer(store):
+    store.start("a")
+    assert store.get("a") == (0, 0)
+    assert store.advance("a", 0, True) == (1, 1)
+    assert store.advance("a", 1, False) == (2, 1)
+    assert store.get("a") == (2, 1)
+
+
+def test_duplicate_answer_does_not_skip_a_question(store):
+    store.start("a")
+    assert store.advance("a", 0, True) == (1, 1)
+    assert store.advance("a", 0, True) is None
+    assert store.get("a") == (1, 1)
+
+
+def test_advance_after_delete_does_not_resurrect_session(store):
+    store.start("a")
+    store.delete("a")
+    assert store.advance("a", 0, True) is None
+    assert store.get("a") is None
+
+
+def test_last_answer_ends_session(store):
+    store.start("a")
+    for i in range(QUESTION_COUNT - 1):
+        store.advance("a", i, True)
+    assert store.advance("a", QUESTION_COUNT - 1, False) == (QUESTION_COUNT, QUESTION_COUNT - 1)
+    assert store.get("a") is None
+    # An overlapping reply to the last question finds nothing to advance
+    assert store.advance("a", QUESTION_COUNT - 1, True) is None
+
+
+def test_redis_session_past_last_question_reads_as_missing(monkeypatch):
+    # e.g. a session left over from before questions.json was shortened
+    store = _redis_store(monkeypatch)
+    store._redis.set(store._key("a"), (QUESTION_COUNT + 2) << SCORE_BITS)
+    assert store.get("a") is None